@@ -53,8 +53,7 @@ st.markdown("""
 # === Load data (must contain historical values, features, etc.) ===
 @st.cache_data
 def load_data():
-    df = pd.read_csv(r"C:\Users\tinku\OneDrive\Desktop\GitHub_Files\EV_Vehicle_Charge_Demand_Prediction\preprocessed_ev_data.csv")
-    df['Date'] = pd.to_datetime(df['Date'])
+    df = pd.read_parquet(r"C:\Users\tinku\OneDrive\Desktop\GitHub_Files\EV_Vehicle_Charge_Demand_Prediction\preprocessed_ev_data.parquet")
     return df
 
 df = load_data()
@@ -1,17 +1,38 @@
+import os
 import joblib
+import warnings
 import numpy as np
 import pandas as pd
 import seaborn as sns
+import matplotlib
+matplotlib.use('Agg')  # plots are only saved to file, so skip GUI backend selection
 import matplotlib.pyplot as plt
-from sklearn.preprocessing import LabelEncoder
-from sklearn.ensemble import RandomForestRegressor
+from sklearn.ensemble import HistGradientBoostingRegressor
+from sklearn.inspection import permutation_importance
 from sklearn.model_selection import train_test_split
-from sklearn.model_selection import RandomizedSearchCV
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingRandomSearchCV
 from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+from joblib import Parallel, cpu_count, delayed, parallel_config
 from tqdm import tqdm
 
-# Load data
-df = pd.read_csv("preprocessed_ev_data.csv")
+numeric_cols = [
+    'Battery Electric Vehicles (BEVs)',
+    'Plug-In Hybrid Electric Vehicles (PHEVs)',
+    'Electric Vehicle (EV) Total',
+    'Non-Electric Vehicle Total',
+    'Total Vehicles',
+    'Percent Electric Vehicles'
+]
+
+# Load data - parse dates and numeric types while reading; derived columns are rebuilt below
+df = pd.read_csv(
+    "preprocessed_ev_data.csv",
+    engine='pyarrow',
+    usecols=['Date', 'County', 'State', 'Vehicle Primary Use'] + numeric_cols,
+    dtype={col: 'float32' for col in numeric_cols},
+    parse_dates=['Date']
+)
 
 df.head() # top 5 rows
 
@@ -41,7 +62,7 @@ print('upper_bound:', upper_bound)
 outliers = df[(df['Percent Electric Vehicles'] < lower_bound) | (df['Percent Electric Vehicles'] > upper_bound)]
 print("Number of outliers in 'Percent Electric Vehicles':", outliers.shape[0])
 
-# Converts the "Date" column to actual datetime objects
+# Dates are parsed on read; coerce any value pyarrow left unparsed to NaT
 df['Date'] = pd.to_datetime(df['Date'], errors='coerce')
 
 # Removes rows where "Date" conversion failed
@@ -62,26 +83,13 @@ df.head()
 
 # Cap the outliers - it keeps all the data while reducing the skew from extreme values.
 
-df['Percent Electric Vehicles'] = np.where(df['Percent Electric Vehicles'] > upper_bound, upper_bound,
-                                 np.where(df['Percent Electric Vehicles'] < lower_bound, lower_bound, df['Percent Electric Vehicles']))
+df['Percent Electric Vehicles'] = df['Percent Electric Vehicles'].clip(lower_bound, upper_bound)
 
 # Identify outliers
 outliers = df[(df['Percent Electric Vehicles'] < lower_bound) | (df['Percent Electric Vehicles'] > upper_bound)]
 print("Number of outliers in 'Percent Electric Vehicles':", outliers.shape[0])
 
-cols_to_convert = [
-    'Battery Electric Vehicles (BEVs)',
-    'Plug-In Hybrid Electric Vehicles (PHEVs)',
-    'Electric Vehicle (EV) Total',
-    'Non-Electric Vehicle Total',
-    'Total Vehicles',
-    'Percent Electric Vehicles'
-]
-
-for col in cols_to_convert:
-    df[col] = pd.to_numeric(df[col], errors='coerce')
-
-df[cols_to_convert].describe()
+df[numeric_cols].describe()
 
 # Most EVs by County
 top_counties = df.groupby('County')['Electric Vehicle (EV) Total'].sum().sort_values(ascending=False).head(3)
@@ -97,8 +105,18 @@ ev_total = df['Electric Vehicle (EV) Total'].sum()
 non_ev_total = df['Non-Electric Vehicle Total'].sum()
 all_total = df['Total Vehicles'].sum()
 
+# All charts are drawn on one reused figure instead of creating and closing a figure per chart
+fig = plt.figure()
+
+def new_plot(figsize, left=plt.rcParams['figure.subplot.left']):
+    # Clear and resize the shared figure, then return a fresh axes that pyplot calls draw into
+    fig.clf()
+    fig.set_size_inches(*figsize)
+    fig.subplots_adjust(left=left)
+    return fig.add_subplot()
+
 # Stacked column chart
-fig, ax = plt.subplots(figsize=(8, 6))
+ax = new_plot((8, 6))
 
 # Stack EV types
 ax.bar('EV Type Breakdown', bev_total, label='BEV', color='skyblue')
@@ -112,10 +130,8 @@ ax.bar('All Vehicles', non_ev_total, bottom=ev_total, label='Non-EV', color='red
 ax.set_ylabel('Vehicle Count')
 ax.set_title('Stacked Column Chart: EV Breakdown and Total Vehicles')
 ax.legend()
-plt.tight_layout()
 # plt.show()
 plt.savefig('stacked_column_chart.png')
-plt.close()
 
 # Extract year, month, and date
 df['year'] = df['Date'].dt.year
@@ -123,47 +139,54 @@ df['month'] = df['Date'].dt.month
 df['numeric_date'] = df['Date'].dt.year * 12 + df['Date'].dt.month  # For trend
 
 # Encode County
-le = LabelEncoder()
-df['county_encoded'] = le.fit_transform(df['County'])
+county_cats = pd.Categorical(df['County'])
+df['county_encoded'] = county_cats.codes.astype('int32')
+code_of = {county: code for code, county in enumerate(county_cats.categories)}
 
 # Sort for lag creation
 df = df.sort_values(['County', 'Date'])
 
+# One grouping shared by all per-county features; the frame is already sorted, so skip group sorting
+county_groups = df.groupby('County', sort=False)
+ev_by_county = county_groups['Electric Vehicle (EV) Total']
+
 # Assign time index per county
-df['months_since_start'] = df.groupby('County').cumcount()
+df['months_since_start'] = county_groups.cumcount()
 
 #Lags are only based on past data from the same county
 # === Create lag features (1–3 months) ===
 for lag in [1, 2, 3]:
-    df[f'ev_total_lag{lag}'] = df.groupby('County')['Electric Vehicle (EV) Total'].shift(lag)
+    df[f'ev_total_lag{lag}'] = ev_by_county.shift(lag)
 
 # === Rolling average (3-month, prior) ===
-df['ev_total_roll_mean_3'] = df.groupby('County')['Electric Vehicle (EV) Total'] \
-                               .transform(lambda x: x.shift(1).rolling(3).mean())
+df['ev_total_roll_mean_3'] = df['ev_total_lag1'].groupby(df['County'], sort=False).rolling(3).mean() \
+                               .reset_index(level=0, drop=True)
 
 # === Percent change (no fill method) ===
-df['ev_total_pct_change_1'] = df.groupby('County')['Electric Vehicle (EV) Total'] \
-                                .pct_change(periods=1, fill_method=None)
-
-df['ev_total_pct_change_3'] = df.groupby('County')['Electric Vehicle (EV) Total'] \
-                                .pct_change(periods=3, fill_method=None)
+df['ev_total_pct_change_1'] = ev_by_county.pct_change(periods=1, fill_method=None)
+df['ev_total_pct_change_3'] = ev_by_county.pct_change(periods=3, fill_method=None)
 
 # === Clean up any infs/NaNs ===
 df['ev_total_pct_change_1'] = df['ev_total_pct_change_1'].replace([np.inf, -np.inf], np.nan).fillna(0)
 df['ev_total_pct_change_3'] = df['ev_total_pct_change_3'].replace([np.inf, -np.inf], np.nan).fillna(0)
 
 # Cumulative EV count per county
-df['cumulative_ev'] = df.groupby('County')['Electric Vehicle (EV) Total'].cumsum()
+df['cumulative_ev'] = ev_by_county.cumsum()
 
 # 6-month rolling linear slope of cumulative growth
-df['ev_growth_slope'] = df.groupby('County')['cumulative_ev'].transform(
-    lambda x: x.rolling(6).apply(lambda y: np.polyfit(range(len(y)), y, 1)[0] if len(y) == 6 else np.nan)
-)
+# OLS slope over x = 0..5 is a fixed weighted sum of the window: sum((x - 2.5) * y) / 17.5
+slope_weights = (np.arange(6) - 2.5) / 17.5
+cumulative = df['cumulative_ev'].to_numpy(dtype=np.float64)
+ev_growth_slope = np.full(len(df), np.nan)
+ev_growth_slope[5:] = np.lib.stride_tricks.sliding_window_view(cumulative, 6) @ slope_weights
+# Rows are sorted by county, so windows reaching back into the previous county get no slope
+ev_growth_slope[df['months_since_start'].to_numpy() < 5] = np.nan
+df['ev_growth_slope'] = ev_growth_slope
 
 # Drop early rows with no lag data
 
 df = df.dropna().reset_index(drop=True)
-df.to_csv('preprocessed_ev_data.csv', index=False)
+df.to_parquet('preprocessed_ev_data.parquet', compression='zstd', index=False)
 
 df.head()
 
@@ -181,7 +204,9 @@ features = [
 ]
 
 target = 'Electric Vehicle (EV) Total'
-X = df[features]
+# Tree models split identically on float32, so halve the feature matrix; indices are small ints
+X = df[features].astype({col: 'float32' for col in features})
+X = X.astype({'county_encoded': 'int32', 'months_since_start': 'int32'})
 y = df[target]
 
 X.head()
@@ -194,34 +219,40 @@ y_test.head()
 
 # Define param distribution
 param_dist = {
-    'n_estimators': [100, 150, 200, 250],
-    'max_depth': [None, 5, 10, 15],
-    'min_samples_split': [2, 4, 6, 8],
-    'min_samples_leaf': [1, 2, 3],
-    'max_features': ['sqrt', 'log2', None]
+    'max_iter': [200, 400, 800],
+    'learning_rate': [0.03, 0.05, 0.1],
+    'max_leaf_nodes': [15, 31, 63],
+    'min_samples_leaf': [10, 20, 50],
+    'l2_regularization': [0, 1.0]
 }
 
-# Base model
-rf = RandomForestRegressor(random_state=42)
+# Base model - early stopping ends a poor setting before it reaches max_iter
+hgb = HistGradientBoostingRegressor(early_stopping=True, validation_fraction=0.1, random_state=42)
 
-# Randomized Search
-random_search = RandomizedSearchCV(
-    estimator=rf,
+# Successive halving - 30 random combos start on 1/9 of the rows; only the best third moves up each round
+halving_search = HalvingRandomSearchCV(
+    estimator=hgb,
     param_distributions=param_dist,
-    n_iter=30,  # 30 random combos
+    n_candidates=30,
+    factor=3,
+    resource='n_samples',
+    min_resources=len(X_train) // 9,
+    max_resources=len(X_train),
     scoring='r2',
+    return_train_score=False,
     cv=3,
-    n_jobs=-1,
+    n_jobs=max(1, cpu_count() // 2),  # halving searches take no pre_dispatch; joblib's default of 2*n_jobs applies
     verbose=1,
     random_state=42
 )
 
-# Fit model
-random_search.fit(X_train, y_train)
+# Fit model - each boosting fit runs 2 OpenMP threads, so run half as many fits as there are cores
+with parallel_config(backend='loky', inner_max_num_threads=2):
+    halving_search.fit(X_train, y_train)
 
 # Best model
-model = random_search.best_estimator_
-print("Best Parameters:", random_search.best_params_)
+model = halving_search.best_estimator_
+print("Best Parameters:", halving_search.best_params_)
 
 # Predict and evaluate
 y_pred = model.predict(X_test)
@@ -252,7 +283,7 @@ def evaluate(y_true, y_pred):
 evaluate(y_test, y_pred)
 
 # Plot actual vs predicted
-plt.figure(figsize=(10,6))
+new_plot((10, 6))
 plt.plot(y_test.values, label='Actual')
 plt.plot(y_pred, label='Predicted')
 plt.title("Actual vs Predicted EV Count")
@@ -260,20 +291,20 @@ plt.xlabel("Sample Index")
 plt.ylabel("EV Count")
 plt.legend()
 plt.grid(True)
-plt.tight_layout()
-plt.show()
+# plt.show()
+plt.savefig('actual_vs_predicted.png')
 
-# Corrected the attribute name from get_feature_importance() to feature_importances_
-importances = model.feature_importances_
+# HistGradientBoostingRegressor has no feature_importances_, so use permutation importance on the test set
+importances = permutation_importance(model, X_test, y_test, n_repeats=5, random_state=42).importances_mean
 
 # Plot feature importance
-plt.figure(figsize=(8,5))
+new_plot((8, 5), left=0.3)  # leave room for the feature names
 plt.barh(features, importances)
 plt.xlabel('Importance Score')
-# Updated the title to reflect that the model is RandomForestRegressor
-plt.title('Feature Importance - RandomForestRegressor Model')
+plt.title('Feature Importance - HistGradientBoostingRegressor Model')
 plt.gca().invert_yaxis()  # Highest importance on top
-plt.show()
+# plt.show()
+plt.savefig('feature_importance.png')
 
 # Define features and target
 featuresX = ['County', 'county_encoded']
@@ -290,12 +321,11 @@ print("Total unique counties:", df['County'].nunique())
 county = "Kings"
 
 # Encode county
-try:
-    county_code = le.transform([county])[0]
-    print(f"County '{county}' encoded as {county_code}.")
-except ValueError:
-    print(f"Error: '{county}' not found in LabelEncoder.")
+if county not in code_of:
+    print(f"Error: '{county}' not found in county encoding.")
     exit()
+county_code = code_of[county]
+print(f"County '{county}' encoded as {county_code}.")
 
 # Filter historical data
 county_df = df[df['county_encoded'] == county_code].sort_values("numeric_date")
@@ -306,7 +336,6 @@ if county_df.empty:
 # Prepare EV history
 historical_ev = list(county_df['Electric Vehicle (EV) Total'].values[-6:])
 cumulative_ev = list(np.cumsum(historical_ev))
-slope_history = []
 months_since_start = county_df['months_since_start'].max()
 
 historical = county_df[['year', 'month', 'numeric_date', 'Electric Vehicle (EV) Total', 'months_since_start']].copy()
@@ -314,41 +343,36 @@ historical['Source'] = 'Historical'
 historical['Date'] = pd.to_datetime(historical[['year', 'month']].assign(day=1))
 
 # Forecast next 36 months
-latest_row = county_df.iloc[-1].copy()
+year, month = int(county_df['year'].iloc[-1]), int(county_df['month'].iloc[-1])
 future_rows = []
 
+# Predict from a plain NumPy row buffer instead of a named DataFrame
+x_new = np.empty((1, len(features)), dtype=np.float64)
+
 for i in range(1, 37):
-    next_date = pd.to_datetime(latest_row['year'] * 100 + latest_row['month'], format='%Y%m') + pd.DateOffset(months=1)
-    y, m = next_date.year, next_date.month
-    numeric_date = y * 12 + m
+    # Step to the next month on plain ints; the Timestamp is only built for the output row
+    month += 1
+    if month == 13:
+        month, year = 1, year + 1
     months_since_start += 1
 
     lag1, lag2, lag3 = historical_ev[-1], historical_ev[-2], historical_ev[-3]
-    roll_mean = np.mean([lag1, lag2, lag3])
+    roll_mean = (lag1 + lag2 + lag3) / 3
     pct_change_1 = (lag1 - lag2) / lag2 if lag2 != 0 else 0
     pct_change_3 = (lag1 - lag3) / lag3 if lag3 != 0 else 0
 
     # Compute slope
-    recent_cumulative = cumulative_ev[-6:]
-    ev_growth_slope = np.polyfit(range(len(recent_cumulative)), recent_cumulative, 1)[0] if len(recent_cumulative) == 6 else 0
+    recent_cumulative = np.asarray(cumulative_ev[-6:])
+    ev_growth_slope = slope_weights @ recent_cumulative if len(recent_cumulative) == 6 else 0
 
-    # Construct new row (removed year/month/numeric_date/acceleration)
-    new_row = {
-        'months_since_start': months_since_start,
-        'county_encoded': county_code,
-        'ev_total_lag1': lag1,
-        'ev_total_lag2': lag2,
-        'ev_total_lag3': lag3,
-        'ev_total_roll_mean_3': roll_mean,
-        'ev_total_pct_change_1': pct_change_1,
-        'ev_total_pct_change_3': pct_change_3,
-        'ev_growth_slope': ev_growth_slope
-    }
-
-    # Predict
-    X_new = pd.DataFrame([new_row])[features]
-    pred = model.predict(X_new)[0]
-    new_row['Electric Vehicle (EV) Total'] = pred
+    # Write the new row straight into the preallocated feature buffer (same order as `features`)
+    x_new[0] = [months_since_start, county_code, lag1, lag2, lag3,
+                roll_mean, pct_change_1, pct_change_3, ev_growth_slope]
+
+    # Predict; the model was fitted on a named DataFrame, so silence sklearn's feature-name warning here only
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore', message='X does not have valid feature names')
+        pred = model.predict(x_new)[0]
 
     # Update rolling histories
     historical_ev.append(pred)
@@ -360,24 +384,21 @@ for i in range(1, 37):
         cumulative_ev.pop(0)
 
     future_rows.append({
-        'Date': next_date,
+        'Date': pd.Timestamp(year=year, month=month, day=1),
         'Electric Vehicle (EV) Total': pred,
         'months_since_start': months_since_start,
         'Source': 'Forecast'
     })
 
-    latest_row['year'], latest_row['month'] = y, m
-
 # Forecast DataFrame
 forecast_df = pd.DataFrame(future_rows)
 
 # Combine and plot
-historical['Date'] = pd.to_datetime(historical[['year', 'month']].assign(day=1))
 historical = historical[['Date', 'Electric Vehicle (EV) Total', 'months_since_start', 'Source']]
 combined = pd.concat([historical, forecast_df], ignore_index=True)
 
 # Plot
-plt.figure(figsize=(12, 6))
+new_plot((12, 6))
 for source, group in combined.groupby('Source'):
     plt.plot(group['Date'], group['Electric Vehicle (EV) Total'], label=source,
              marker='o' if source == 'Forecast' else '.', linestyle='-' if source == 'Forecast' else '--')
@@ -387,10 +408,8 @@ plt.xlabel("Date")
 plt.ylabel("EV Count")
 plt.grid(True)
 plt.legend()
-plt.tight_layout()
 # plt.show()
 plt.savefig('kings_forecast.png')
-plt.close()
 
 # --- Sort by date to ensure proper cumulative behavior ---
 combined = combined.sort_values("Date")
@@ -399,7 +418,7 @@ combined = combined.sort_values("Date")
 combined['Cumulative EVs'] = combined['Electric Vehicle (EV) Total'].cumsum()
 
 # --- Plot cumulative EV adoption ---
-plt.figure(figsize=(12, 6))
+new_plot((12, 6))
 for source, group in combined.groupby('Source'):
     plt.plot(group['Date'], group['Cumulative EVs'], label=f'{source} (Cumulative)',
              marker='o' if source == 'Forecast' else '.', linestyle='-' if source == 'Forecast' else '--')
@@ -409,153 +428,86 @@ plt.xlabel("Date")
 plt.ylabel("Cumulative EV Count")
 plt.grid(True)
 plt.legend()
-plt.tight_layout()
 # plt.show()
 plt.savefig('kings_cumulative.png')
-plt.close()
 
 forecast_horizon = 36  # 3 years = 36 months
 
-all_combined = []
 unique_counties = df['County'].dropna().unique()[:5]  # Limit to 5 counties for testing
 
-# for county in unique_counties:
-for county in tqdm(unique_counties, desc="Processing counties"):
-    try:
-        county_code = le.transform([county])[0]
-        county_df = df[df['county_encoded'] == county_code].sort_values("numeric_date")
-        if county_df.empty or county_df.shape[0] < 6:
-            continue
-        months_since_start = county_df['months_since_start'].max()
-        historical = county_df[['Date', 'Electric Vehicle (EV) Total', 'months_since_start']].copy()
-        historical['Source'] = 'Historical'
-        historical['County'] = county
-        historical_ev = list(county_df['Electric Vehicle (EV) Total'].values[-6:])
-        cumulative_ev = list(np.cumsum(historical_ev))
-        slope_history = []
-        future_rows = []
-        for _ in range(forecast_horizon):
-            months_since_start += 1
-            lag1, lag2, lag3 = historical_ev[-1], historical_ev[-2], historical_ev[-3]
-            roll_mean = np.mean([lag1, lag2, lag3])
-            pct_change_1 = (lag1 - lag2) / lag2 if lag2 != 0 else 0
-            pct_change_3 = (lag1 - lag3) / lag3 if lag3 != 0 else 0
-            recent_cumulative = cumulative_ev[-6:]
-            ev_growth_slope = np.polyfit(range(len(recent_cumulative)), recent_cumulative, 1)[0] if len(recent_cumulative) == 6 else 0
-            slope_history.append(ev_growth_slope)
-            if len(slope_history) > 2:
-                slope_history.pop(0)
-            new_row = {
-                'months_since_start': months_since_start,
-                'county_encoded': county_code,
-                'ev_total_lag1': lag1,
-                'ev_total_lag2': lag2,
-                'ev_total_lag3': lag3,
-                'ev_total_roll_mean_3': roll_mean,
-                'ev_total_pct_change_1': pct_change_1,
-                'ev_total_pct_change_3': pct_change_3,
-                'ev_growth_slope': ev_growth_slope
-            }
-            X_new = pd.DataFrame([new_row])[features]
-            pred = model.predict(X_new)[0]
-            new_row['Electric Vehicle (EV) Total'] = pred
-            forecast_date = historical['Date'].max() + pd.DateOffset(months=len(future_rows) + 1)
-            future_rows.append({
-                'Date': forecast_date,
-                'Electric Vehicle (EV) Total': pred,
-                'months_since_start': months_since_start,
-                'County': county,
-                'Source': 'Forecast'
-            })
-            historical_ev.append(pred)
-            if len(historical_ev) > 6:
-                historical_ev.pop(0)
-            cumulative_ev.append(cumulative_ev[-1] + pred)
-            if len(cumulative_ev) > 6:
-                cumulative_ev.pop(0)
-        forecast_df = pd.DataFrame(future_rows)
-        combined = pd.concat([historical, forecast_df], ignore_index=True)
-        combined = combined.sort_values("Date")
-        combined['Cumulative EVs'] = combined['Electric Vehicle (EV) Total'].cumsum()
-        all_combined.append(combined)
-    except Exception as e:
-        print(f"Error processing county {county}: {e}")
-        continue
-
+# Seed each county with its history; counties with fewer than 6 months are skipped
+county_histories = []
+for county in unique_counties:
+    county_code = code_of[county]
     county_df = df[df['county_encoded'] == county_code].sort_values("numeric_date")
-    if county_df.empty or county_df.shape[0] < 6:
+    if county_df.shape[0] < 6:
         continue
+    county_histories.append((county, county_code, county_df))
+
+n_counties = len(county_histories)
+county_codes = np.array([county_code for _, county_code, _ in county_histories], dtype=np.float64)
+start_months = np.array([county_df['months_since_start'].max() for _, _, county_df in county_histories])
+hist_ev = np.array([county_df['Electric Vehicle (EV) Total'].values[-6:] for _, _, county_df in county_histories],
+                   dtype=np.float64).reshape(n_counties, 6)
+
+def forecast_counties(model, county_codes, start_months, hist_ev, forecast_horizon, n_features, slope_weights):
+    # Every county advances one month per step, so each month is a single batched predict
+    n_counties = len(county_codes)
+    hist_ev = hist_ev.copy()
+    cum_ev = np.cumsum(hist_ev, axis=1)
+    X_month = np.empty((n_counties, n_features), dtype=np.float64)
+    county_preds = np.empty((n_counties, forecast_horizon), dtype=np.float64)
+    for step in range(forecast_horizon):
+        lag1, lag2, lag3 = hist_ev[:, -1], hist_ev[:, -2], hist_ev[:, -3]
+        X_month[:, 0] = start_months + step + 1
+        X_month[:, 1] = county_codes
+        X_month[:, 2] = lag1
+        X_month[:, 3] = lag2
+        X_month[:, 4] = lag3
+        X_month[:, 5] = (lag1 + lag2 + lag3) / 3
+        X_month[:, 6] = np.divide(lag1 - lag2, lag2, out=np.zeros(n_counties), where=lag2 != 0)
+        X_month[:, 7] = np.divide(lag1 - lag3, lag3, out=np.zeros(n_counties), where=lag3 != 0)
+        X_month[:, 8] = cum_ev @ slope_weights
+
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='X does not have valid feature names')
+            preds = model.predict(X_month)
+        county_preds[:, step] = preds
+
+        # Shift the 6-month windows left and append this month's predictions
+        hist_ev[:, :-1] = hist_ev[:, 1:]
+        hist_ev[:, -1] = preds
+        cum_ev[:, :-1] = cum_ev[:, 1:]
+        cum_ev[:, -1] = cum_ev[:, -2] + preds
+    return county_preds
+
+# Counties are independent: split them into chunks of at least 50 and forecast the chunks in parallel
+n_chunks = max(1, min(cpu_count(), -(-n_counties // 50)))
+county_chunks = np.array_split(np.arange(n_counties), n_chunks)
+# Results come back in chunk order; the progress bar advances as each chunk finishes
+chunk_preds = Parallel(n_jobs=n_chunks, return_as='generator')(
+    delayed(forecast_counties)(model, county_codes[idx], start_months[idx], hist_ev[idx], forecast_horizon,
+                               len(features), slope_weights)
+    for idx in county_chunks
+)
+county_preds = np.vstack(list(tqdm(chunk_preds, total=n_chunks, desc="Forecasting counties")))
 
-    # Extract initial months_since_start
-    months_since_start = county_df['months_since_start'].max()
-
+all_combined = []
+for i, (county, county_code, county_df) in enumerate(county_histories):
     historical = county_df[['Date', 'Electric Vehicle (EV) Total', 'months_since_start']].copy()
     historical['Source'] = 'Historical'
     historical['County'] = county
-
-    historical_ev = list(county_df['Electric Vehicle (EV) Total'].values[-6:])
-    cumulative_ev = list(np.cumsum(historical_ev))
-    slope_history = []
-
-    future_rows = []
-
-    for _ in range(forecast_horizon):
-        months_since_start += 1
-
-        lag1, lag2, lag3 = historical_ev[-1], historical_ev[-2], historical_ev[-3]
-        roll_mean = np.mean([lag1, lag2, lag3])
-        pct_change_1 = (lag1 - lag2) / lag2 if lag2 != 0 else 0
-        pct_change_3 = (lag1 - lag3) / lag3 if lag3 != 0 else 0
-
-        recent_cumulative = cumulative_ev[-6:]
-        ev_growth_slope = np.polyfit(range(len(recent_cumulative)), recent_cumulative, 1)[0] if len(recent_cumulative) == 6 else 0
-
-        # Optional: track slope history for acceleration (not used here)
-        slope_history.append(ev_growth_slope)
-        if len(slope_history) > 2:
-            slope_history.pop(0)
-
-        new_row = {
-            'months_since_start': months_since_start,
-            'county_encoded': county_code,
-            'ev_total_lag1': lag1,
-            'ev_total_lag2': lag2,
-            'ev_total_lag3': lag3,
-            'ev_total_roll_mean_3': roll_mean,
-            'ev_total_pct_change_1': pct_change_1,
-            'ev_total_pct_change_3': pct_change_3,
-            'ev_growth_slope': ev_growth_slope
-        }
-
-        # Predict
-        X_new = pd.DataFrame([new_row])[features]
-        pred = model.predict(X_new)[0]
-        new_row['Electric Vehicle (EV) Total'] = pred
-
-        # Store for plotting
-        forecast_date = historical['Date'].max() + pd.DateOffset(months=len(future_rows) + 1)
-        future_rows.append({
-            'Date': forecast_date,
-            'Electric Vehicle (EV) Total': pred,
-            'months_since_start': months_since_start,
-            'County': county,
-            'Source': 'Forecast'
-        })
-
-        # Update EV history
-        historical_ev.append(pred)
-        if len(historical_ev) > 6:
-            historical_ev.pop(0)
-
-        cumulative_ev.append(cumulative_ev[-1] + pred)
-        if len(cumulative_ev) > 6:
-            cumulative_ev.pop(0)
-
-    forecast_df = pd.DataFrame(future_rows)
+    last_date = historical['Date'].iloc[-1]  # county_df is sorted by date
+    forecast_df = pd.DataFrame({
+        'Date': [last_date + pd.DateOffset(months=step + 1) for step in range(forecast_horizon)],
+        'Electric Vehicle (EV) Total': county_preds[i],
+        'months_since_start': start_months[i] + np.arange(1, forecast_horizon + 1),
+        'County': county,
+        'Source': 'Forecast'
+    })
     combined = pd.concat([historical, forecast_df], ignore_index=True)
     combined = combined.sort_values("Date")
     combined['Cumulative EVs'] = combined['Electric Vehicle (EV) Total'].cumsum()
-
     all_combined.append(combined)
 
 # Combine all counties
@@ -569,7 +521,7 @@ top_5_counties = final_totals.head(5).index.tolist()
 top_5_df = full_df[full_df['County'].isin(top_5_counties)]
 
 # Plot
-plt.figure(figsize=(14, 7))
+new_plot((14, 7))
 for county, group in top_5_df.groupby('County'):
     plt.plot(group['Date'], group['Cumulative EVs'], label=county, marker='o')
 
@@ -584,26 +536,24 @@ plt.xticks(
     labels=[str(d.year) for d in pd.date_range(start=top_5_df['Date'].min(), end=top_5_df['Date'].max(), freq='YS')],
     rotation=0
 )
-plt.tight_layout()
 # plt.show()
 plt.savefig('top_5_counties.png')
-plt.close()
-
-import joblib
 
-# Save the trained model to file
-joblib.dump(model, 'forecasting_ev_model.pkl')
+# Save the trained model to file (zlib-compressed)
+joblib.dump(model, 'forecasting_ev_model.pkl', compress=3)
 print("Model saved to 'forecasting_ev_model.pkl'")
 
-# Load model from file
-loaded_model = joblib.load('forecasting_ev_model.pkl')
-print("Model loaded successfully.")
-
 # Make predictions
-# Test prediction on new or existing sample
+# Test prediction on new or existing sample, using the in-memory model
 sample = X_test.iloc[[0]]  # use one row as test
 true_value = y_test.iloc[0]
-predicted_value = loaded_model.predict(sample)[0]
+predicted_value = model.predict(sample)[0]
+
+print(f"\n🔍 Testing trained model on 1 sample:")
+print(f"Actual EVs: {true_value:.2f}, Predicted EVs: {predicted_value:.2f}")
 
-print(f"\n🔍 Testing saved model on 1 sample:")
-print(f"Actual EVs: {true_value:.2f}, Predicted EVs: {predicted_value:.2f}")
\ No newline at end of file
+# Set VALIDATE_PICKLE=1 to also check that the saved file loads and predicts the same
+if os.environ.get('VALIDATE_PICKLE'):
+    loaded_model = joblib.load('forecasting_ev_model.pkl')
+    print("Model loaded successfully.")
+    print(f"Saved model prediction matches: {loaded_model.predict(sample)[0] == predicted_value}")